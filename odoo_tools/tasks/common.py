@@ -2,13 +2,15 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
 
-import errno
+import hashlib
 import os
+import shlex
 import shutil
+import subprocess
 import tempfile
+from collections import OrderedDict
 from contextlib import contextmanager
 from functools import lru_cache
-from subprocess import Popen
 
 import yaml
 from invoke import exceptions
@@ -19,6 +21,14 @@ except ImportError:
     print("Missing ruamel.yaml from requirements")
     print("Please run `pip install -r tasks/requirements.txt`")
 
+try:
+    # libyaml-backed loader, much faster than the pure-Python one
+    from yaml import CSafeLoader as YAML_LOADER
+except ImportError:
+    print("PyYAML is not built against libyaml, YAML parsing will be slow")
+    print("Please install libyaml and reinstall PyYAML")
+    from yaml import SafeLoader as YAML_LOADER
+
 
 def exit_msg(message):
     print(message)
@@ -26,14 +36,16 @@ def exit_msg(message):
 
 
 def root_path():
-    current_dir = (
-        os.getcwd()
-    )  # directory from where search for .cookiecutter.context.yml starts
+    # directory from where search for .cookiecutter.context.yml starts
+    return _root_path(os.getcwd())
+
+
+@lru_cache(maxsize=8)
+def _root_path(current_dir):
     max_depth = 5
     while max_depth > 0:
-        file_list = os.listdir(current_dir)
         parent_dir = os.path.dirname(current_dir)
-        if ".cookiecutter.context.yml" in file_list:
+        if os.path.exists(os.path.join(current_dir, ".cookiecutter.context.yml")):
             return current_dir
         else:
             if current_dir == parent_dir:
@@ -57,12 +69,30 @@ def build_path(path, from_root=True, from_file=None):
 
 # TODO: change depending on new structure
 # use root_path to get root project directory
-VERSION_FILE = build_path("odoo/VERSION")
-HISTORY_FILE = build_path("HISTORY.rst")
-PENDING_MERGES_DIR = build_path("pending-merges.d")
-MIGRATION_FILE = build_path("odoo/migration.yml")
-GITIGNORE_FILE = build_path(".gitignore")
-COOKIECUTTER_CONTEXT = build_path(".cookiecutter.context.yml")
+def version_file():
+    return build_path("odoo/VERSION")
+
+
+def history_file():
+    return build_path("HISTORY.rst")
+
+
+def pending_merges_dir():
+    return build_path("pending-merges.d")
+
+
+def migration_file():
+    return build_path("odoo/migration.yml")
+
+
+def gitignore_file():
+    return build_path(".gitignore")
+
+
+def cookiecutter_context_file():
+    return build_path(".cookiecutter.context.yml")
+
+
 GIT_C2C_REMOTE_NAME = "camptocamp"
 TEMPLATE_GIT_REPO_URL = "git@github.com:{}.git"
 TEMPLATE_GIT = TEMPLATE_GIT_REPO_URL.format("camptocamp/odoo-template")
@@ -82,17 +112,54 @@ def gpg_decrypt_to_file(ctx, file_name, password=False):
 
 
 def yaml_load(stream, Loader=None):
-    return yaml.load(stream, Loader=Loader or yaml.FullLoader)
+    """Load YAML from a string or an open file.
+
+    Pass the file object rather than its content: libyaml reads it directly.
+    """
+    return yaml.load(stream, Loader=Loader or YAML_LOADER)
+
+
+# parsed YAML files, by digest of their content, least recently used first
+YAML_CACHE = OrderedDict()
+YAML_CACHE_SIZE = 128
+
+
+def file_digest(fileobj):
+    if hasattr(hashlib, "file_digest"):
+        # python >= 3.11, hashes the file without reading it in Python
+        return hashlib.file_digest(fileobj, "blake2b").digest()
+    return hashlib.blake2b(fileobj.read()).digest()
+
+
+def yaml_load_path(path):
+    """Load a YAML file, reusing the parsed data while the file is unchanged.
+
+    The returned data is shared between callers: do not mutate it.
+    """
+    with open(path, "rb") as f:
+        digest = file_digest(f)
+        if digest in YAML_CACHE:
+            YAML_CACHE.move_to_end(digest)
+        else:
+            f.seek(0)
+            if len(YAML_CACHE) >= YAML_CACHE_SIZE:
+                # drop the least recently used entry
+                YAML_CACHE.popitem(last=False)
+            YAML_CACHE[digest] = yaml_load(f)
+    return YAML_CACHE[digest]
 
 
 @lru_cache(maxsize=None)
 def cookiecutter_context():
-    with open(COOKIECUTTER_CONTEXT) as f:
-        return yaml_load(f.read())
+    return yaml_load_path(cookiecutter_context_file())
 
 
 @contextmanager
 def cd(path):
+    """Change the working directory of the whole process.
+
+    Prefer `run_in` to run commands from another directory.
+    """
     prev = os.getcwd()
     os.chdir(os.path.expanduser(path))
     try:
@@ -101,8 +168,14 @@ def cd(path):
         os.chdir(prev)
 
 
+def run_in(ctx, path, cmd, **kwargs):
+    """Run a command from `path`, keeping our own working directory."""
+    with ctx.cd(os.path.expanduser(path)):
+        return ctx.run(cmd, **kwargs)
+
+
 def current_version():
-    with open(VERSION_FILE) as fd:
+    with open(version_file()) as fd:
         version = fd.read().strip()
     return version
 
@@ -121,9 +194,12 @@ def ask_or_abort(message):
 
 def check_git_diff(ctx, direct_abort=False):
     try:
-        ctx.run("git diff --quiet --exit-code")
-        ctx.run("git diff --cached --quiet --exit-code")
+        # staged and unstaged changes at once
+        res = ctx.run("git status --porcelain --untracked-files=no", hide=True)
+        dirty = bool(res.stdout.strip())
     except exceptions.Failure:
+        dirty = True
+    if dirty:
         if direct_abort:
             exit_msg("Your repository has local changes. Abort.")
         ask_or_abort(
@@ -137,55 +213,79 @@ def tempdir():
     try:
         yield name
     finally:
-        try:
-            shutil.rmtree(name)
-        except OSError as e:
-            # already deleted
-            if e.errno != errno.ENOENT:
-                raise
+        # it may have been deleted already
+        shutil.rmtree(name, ignore_errors=True)
 
 
 def search_replace(file_path, old, new):
-    """Replace a text in a file on each lines"""
-    shutil.move(file_path, file_path + ".bak")
-    with open(file_path + ".bak") as f_r:
-        with open(file_path, "w") as f_w:
-            for line in f_r:
-                f_w.write(line.replace(old, new))
-
+    """Replace a text in a file.
 
-def update_yml_file(path, new_data, main_key=None):
+    The new content is written to a temporary file which then replaces
+    the original one, so that the file is never left half written.
+    """
+    with open(file_path, "rb") as f_r:
+        content = f_r.read().replace(old.encode(), new.encode())
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(os.path.abspath(file_path)), delete=False
+    ) as f_w:
+        try:
+            f_w.write(content)
+            f_w.close()
+            shutil.copymode(file_path, f_w.name)
+            os.replace(f_w.name, file_path)
+        except BaseException:
+            # do not leave the temporary file behind
+            os.unlink(f_w.name)
+            raise
+
+
+@lru_cache(maxsize=4)
+def _round_trip_yaml(mapping=2, sequence=4, offset=2):
     yaml = YAML()
     # preservation of indentation
-    yaml.indent(mapping=2, sequence=4, offset=2)
+    yaml.indent(mapping=mapping, sequence=sequence, offset=offset)
+    return yaml
+
 
+def update_yml_file(path, new_data, main_key=None):
+    # load and dump with the same round-trip engine to keep comments
+    yaml = _round_trip_yaml()
     with open(path) as f:
-        data = yaml_load(f.read())
-        if main_key:
-            data[main_key].update(new_data)
-        else:
-            data.update(new_data)
+        data = yaml.load(f)
+    if main_key:
+        data[main_key].update(new_data)
+    else:
+        data.update(new_data)
 
     with open(path, "w") as f:
         yaml.dump(data, f)
 
 
 def git_ignores(file):
-    ignored = []
-    with open(file) as f:
-        for line in f.read().splitlines():
-            if line.strip() and not line.startswith("#"):
-                ignored.append(line)
-    return ignored
+    with open(file, "rb") as f:
+        data = f.read()
+    # non blank lines, except comments
+    return [
+        line.decode() for line in data.splitlines() if line[:1] != b"#" and line.strip()
+    ]
 
 
-def git_ignores_global(ctx):
-    return git_ignores(
-        ctx.run("git config --global core.excludesfile", hide=True).stdout.strip()
-    )
+def git_ignores_global(ctx=None):
+    # `ctx` is kept for backward compatibility
+    return list(_git_ignores_global())
 
 
-GIT_IGNORES = git_ignores(GITIGNORE_FILE)
+@lru_cache(maxsize=1)
+def _git_ignores_global():
+    # the global configuration is not expected to change during a run
+    path = subprocess.check_output(
+        ["git", "config", "--global", "core.excludesfile"], universal_newlines=True
+    ).strip()
+    return git_ignores(os.path.expanduser(path))
+
+
+def git_ignores_local():
+    return git_ignores(gitignore_file())
 
 
 def get_from_lastpass(ctx, note_id, get_field):
@@ -195,17 +295,37 @@ def get_from_lastpass(ctx, note_id, get_field):
     :param get_field: Lastpass field to get (as specified on lpass --help
                       for show command)
     :return: Value of the field for this note
+
+    Values are kept in memory for the rest of the run,
+    unless ODOOTOOLS_NO_LPASS_CACHE is set in the environment.
     """
     password = False
+    lpass_show = _lpass_show
+    if os.environ.get("ODOOTOOLS_NO_LPASS_CACHE"):
+        lpass_show = _lpass_show.__wrapped__
     try:
-        password = ctx.run(
-            "lpass show {} {}".format(get_field, note_id), hide=True
-        ).stdout.strip()
+        password = lpass_show(note_id, get_field)
+    except subprocess.CalledProcessError as expt:
+        print("Error in get_from_lastpass : {}\n{}".format(expt, expt.stderr.strip()))
     except Exception as expt:
         print("Error in get_from_lastpass : {}".format(expt))
     return password
 
 
+@lru_cache(maxsize=256)
+def _lpass_show(note_id, get_field):
+    # failures raise, so they are never cached
+    # get_field may hold several options (eg: "--field=user --sync=no")
+    cmd = ["lpass", "show"] + shlex.split(get_field) + [note_id]
+    return subprocess.run(
+        cmd,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout.strip()
+
+
 def make_dir(path_dir):
     try:
         os.makedirs(path_dir)
@@ -219,25 +339,69 @@ def make_dir(path_dir):
             pass  # directory already exists, nothing to do in this case
 
 
+def _yaml_node_get(node, key):
+    """Get the value node of `key` in a composed YAML mapping node.
+
+    Keys merged with `<<` are looked up after the explicit ones.
+    """
+    if isinstance(node, yaml.MappingNode):
+        merged = []
+        for key_node, value_node in node.value:
+            if key_node.tag == "tag:yaml.org,2002:merge":
+                if isinstance(value_node, yaml.SequenceNode):
+                    merged.extend(value_node.value)
+                else:
+                    merged.append(value_node)
+            elif key_node.value == key:
+                return value_node
+        for merged_node in merged:
+            try:
+                return _yaml_node_get(merged_node, key)
+            except KeyError:
+                pass
+    raise KeyError(key)
+
+
 def get_migration_file_modules(migration_file):
-    """Read the migration.yml and get module list."""
+    """Read the migration.yml and get module list.
+
+    The file is only composed into YAML nodes, no Python object is built
+    for the parts of the document we do not need.
+    """
     with open(migration_file) as stream:
-        content = yaml_load(stream)
+        content = yaml.compose(stream, Loader=YAML_LOADER)
     modules = set()
-    for version in range(len(content["migration"]["versions"])):
+    versions = _yaml_node_get(_yaml_node_get(content, "migration"), "versions")
+    for version in versions.value:
         try:
-            migration_version = content["migration"]["versions"][version]
-            modules.update(migration_version["addons"]["upgrade"])
+            upgrade = _yaml_node_get(_yaml_node_get(version, "addons"), "upgrade")
         except KeyError:
-            pass
+            continue
+        if isinstance(upgrade, yaml.SequenceNode):
+            modules.update(node.value for node in upgrade.value)
     return modules
 
 
+@lru_cache(maxsize=None)
 def has_exec(name):
-    try:
-        devnull = open(os.devnull, "w")
-        Popen([name], stdout=devnull, stderr=devnull).communicate()
-    except OSError as err:
-        if err.errno == os.errno.ENOENT:
-            return False
-    return True
+    """Check whether the executable is available in PATH."""
+    return shutil.which(name) is not None
+
+
+# Former module constants, now computed on access
+# from the current working directory (PEP 562)
+LAZY_ATTRIBUTES = {
+    "VERSION_FILE": version_file,
+    "HISTORY_FILE": history_file,
+    "PENDING_MERGES_DIR": pending_merges_dir,
+    "MIGRATION_FILE": migration_file,
+    "GITIGNORE_FILE": gitignore_file,
+    "COOKIECUTTER_CONTEXT": cookiecutter_context_file,
+    "GIT_IGNORES": git_ignores_local,
+}
+
+
+def __getattr__(name):
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
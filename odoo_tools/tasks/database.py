@@ -10,7 +10,7 @@ from datetime import datetime
 import psycopg2
 from invoke import task
 
-from .common import cd, cookiecutter_context, exit_msg, make_dir
+from .common import cookiecutter_context, exit_msg, make_dir
 
 
 def get_default_parameters():
@@ -200,14 +200,14 @@ def download_dump(ctx, platform="", customer="", env="int", dump_name="", dumpdi
     # fname is like fighting_snail_1024[...].pg
     fname = os.path.splitext(gpg_fname)[0]
     make_dir(dumpdir)
-    with cd(dumpdir):
-        if not os.path.isfile(fname):
-            print("Azure Downloading dump...{}".format(database_name))
-            print("From: {} {} of {}".format(p_platform, env, p_customer))
-            print("to: {}".format(os.getcwd()))
+    if not os.path.isfile(os.path.join(dumpdir, fname)):
+        print("Azure Downloading dump...{}".format(database_name))
+        print("From: {} {} of {}".format(p_platform, env, p_customer))
+        print("to: {}".format(os.path.abspath(dumpdir)))
+        with ctx.cd(dumpdir):
             _download_from_azure(ctx, p_platform, p_customer, env, database_name)
-        else:
-            print("A file named {} already exists, skipping download.".format(fname))
+    else:
+        print("A file named {} already exists, skipping download.".format(fname))
     return fname
 
 
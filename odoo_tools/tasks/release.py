@@ -2,22 +2,23 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
 import fileinput
+import os
+import re
 from datetime import date
-from distutils.version import StrictVersion
 
 from invoke import exceptions, task
 from marabunta.version import MarabuntaVersion
 
 from .common import (
     GIT_C2C_REMOTE_NAME,
-    HISTORY_FILE,
-    MIGRATION_FILE,
-    VERSION_FILE,
-    cd,
     check_git_diff,
     cookiecutter_context,
     current_version,
     exit_msg,
+    history_file,
+    migration_file,
+    run_in,
+    version_file,
 )
 from .submodule import Repo
 
@@ -55,7 +56,7 @@ def push_branches(ctx, force=False):
         check_git_diff(ctx)
     print("Pushing pending-merge branches...")
 
-    # look through all of the files inside PENDING_MERGES_DIR, push everything
+    # look through all of the files inside pending_merges_dir(), push everything
     impacted_repos = []
     for repo in Repo.repositories_from_pending_folder():
         if not repo.has_pending_merges():
@@ -63,23 +64,36 @@ def push_branches(ctx, force=False):
         config = repo.merges_config()
         impacted_repos.append(repo.path)
         print("pushing {}".format(repo.path))
-        with cd(repo.abs_path):
-            try:
-                ctx.run("git config remote.{}.url".format(GIT_C2C_REMOTE_NAME))
-            except exceptions.Failure:
-                remote_url = config["remotes"][GIT_C2C_REMOTE_NAME]
-                ctx.run("git remote add {} {}".format(GIT_C2C_REMOTE_NAME, remote_url))
-            ctx.run(
-                "git push -f -v {} HEAD:refs/heads/{}".format(
-                    GIT_C2C_REMOTE_NAME, branch_name
-                )
+        try:
+            run_in(
+                ctx,
+                repo.abs_path,
+                "git config remote.{}.url".format(GIT_C2C_REMOTE_NAME),
             )
+        except exceptions.Failure:
+            remote_url = config["remotes"][GIT_C2C_REMOTE_NAME]
+            run_in(
+                ctx,
+                repo.abs_path,
+                "git remote add {} {}".format(GIT_C2C_REMOTE_NAME, remote_url),
+            )
+        run_in(
+            ctx,
+            repo.abs_path,
+            "git push -f -v {} HEAD:refs/heads/{}".format(
+                GIT_C2C_REMOTE_NAME, branch_name
+            ),
+        )
     if impacted_repos:
         print("Impacted submodules:")
         for name in impacted_repos:
             print(" - {}".format(name))
 
 
+# numeric part of a 3-digits version, as accepted by StrictVersion
+VERSION3DIGITS_RE = re.compile(r"^(\d+)\.(\d+)(?:\.(\d+))?(?:[ab]\d+)?$")
+
+
 def release_get_next_version3digits(old_version, feature=True, patch=False):
     """Backward compat for old 3-digits versionins.
 
@@ -94,10 +108,10 @@ def release_get_next_version3digits(old_version, feature=True, patch=False):
     print(warning)
     print("!" * len(warning))
     print()
-    try:
-        version = StrictVersion(old_version).version
-    except ValueError:
+    match = VERSION3DIGITS_RE.match(old_version)
+    if not match:
         exit_msg("'{}' is not a valid version".format(old_version))
+    version = tuple(int(v or 0) for v in match.groups())
     if feature:
         new_version = (version[0], version[1] + 1, 0)
     elif patch:
@@ -126,6 +140,16 @@ def release_get_next_version(old_version, major=False, feature=True, patch=False
     return ".".join([str(v) for v in new_version])
 
 
+def migration_file_has_version(version):
+    """Check if the migration file already has a step for this version."""
+    path = migration_file()
+    if not os.path.exists(path):
+        return False
+    pattern = re.compile(r"- version:.*{}".format(re.escape(version)))
+    with open(path) as fd:
+        return any(pattern.search(line) for line in fd)
+
+
 @task
 def bump(ctx, major=False, feature=False, patch=False, print_only=False):
     """Increase the version number where needed"""
@@ -144,23 +168,19 @@ def bump(ctx, major=False, feature=False, patch=False, print_only=False):
     if print_only:
         exit_msg("PRINT ONLY mode on. Exiting...")
 
-    try:
-        ctx.run(
-            r'grep --quiet --regexp "- version:.*{}" {}'.format(version, MIGRATION_FILE)
-        )
-    except exceptions.Failure:
-        with open(MIGRATION_FILE, "a") as fd:
+    if not migration_file_has_version(version):
+        with open(migration_file(), "a") as fd:
             fd.write("    - version: {}\n".format(version))
 
-    with open(VERSION_FILE, "w") as fd:
+    with open(version_file(), "w") as fd:
         fd.write(version + "\n")
 
     new_version_index = None
-    for index, line in enumerate(fileinput.input(HISTORY_FILE, inplace=True)):
+    for index, line in enumerate(fileinput.input(history_file(), inplace=True)):
         # Weak heuristic to find where we should write the new version
         # header, anyway, it will need manual editing to have a proper
         # changelog
-        if "latest (unreleased)" in line.lower():
+        if new_version_index is None and "latest (unreleased)" in line.lower():
             # place the new header 2 lines after because we have the
             # underlining
             new_version_index = index + 2
@@ -1,6 +1,7 @@
 # Copyright 2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+import copy
 import logging
 import os
 import re
@@ -12,8 +13,6 @@ from invoke import exceptions, task
 
 from .common import (
     GIT_C2C_REMOTE_NAME,
-    MIGRATION_FILE,
-    PENDING_MERGES_DIR,
     ask_confirmation,
     ask_or_abort,
     build_path,
@@ -21,8 +20,11 @@ from .common import (
     cookiecutter_context,
     exit_msg,
     get_migration_file_modules,
+    migration_file,
+    pending_merges_dir,
     root_path,
-    yaml_load,
+    run_in,
+    yaml_load_path,
 )
 from .module import Module
 
@@ -119,9 +121,9 @@ class Repo:
         submodule_name = cls._safe_module_name(name_or_path)
         if submodule_name.lower() in ("odoo", "ocb"):
             submodule_name = "src"
-        base_path = PENDING_MERGES_DIR
+        base_path = pending_merges_dir()
         if relative:
-            base_path = os.path.basename(PENDING_MERGES_DIR)
+            base_path = os.path.basename(base_path)
         return "{}/{}.yml".format(base_path, submodule_name)
 
     def aggregator_config(self):
@@ -136,7 +138,7 @@ class Repo:
 
     @classmethod
     def repositories_from_pending_folder(cls, path=None):
-        path = path or PENDING_MERGES_DIR
+        path = path or pending_merges_dir()
         repo_names = []
         for root, dirs, files in os.walk(path):
             repo_names = [
@@ -152,16 +154,17 @@ class Repo:
         return bool(self.merges_config())
 
     def merges_config(self):
-        with open(self.abs_merges_path) as f:
-            data = yaml_load(f.read()) or {}
-            submodule_relpath = os.path.join(os.path.pardir, self.path)
-            return data.get(submodule_relpath, {})
+        data = yaml_load_path(self.abs_merges_path) or {}
+        submodule_relpath = os.path.join(os.path.pardir, self.path)
+        # the parsed file is shared through the cache, callers alter the config
+        return copy.deepcopy(data.get(submodule_relpath, {}))
 
     def update_merges_config(self, config):
         # get former config if any
         if os.path.exists(self.abs_merges_path):
+            # load with the same round-trip engine used to dump
             with open(self.abs_merges_path) as f:
-                data = yaml_load(f.read())
+                data = yaml.load(f)
         else:
             data = {}
         submodule_relpath = os.path.join(os.path.pardir, self.path)
@@ -237,7 +240,7 @@ def init(ctx):
         hide=True,
     )
     odoo_version = cookiecutter_context()["odoo_version"]
-    with cd(root_path()):
+    with ctx.cd(root_path()):
         for line in res.stdout.splitlines():
             path_key, path = line.split()
             url_key = path_key.replace(".path", ".url")
@@ -346,21 +349,18 @@ def push(ctx, submodule_path, target_branch=None):
 
 def process_travis_file(ctx, repo):
     tf = ".travis.yml"
-    with cd(repo.abs_path):
-        if not os.path.exists(tf):
-            print(
-                repo.abs_path + tf,
-                "does not exists. Skipping travis exclude commit",
-            )
-            return
+    tf_path = os.path.join(repo.abs_path, tf)
+    if not os.path.exists(tf_path):
+        print(tf_path, "does not exists. Skipping travis exclude commit")
+        return
 
-        print("Writing exclude branch option in {}".format(tf))
-        with open(tf, "a") as travis:
-            travis.write(BRANCH_EXCLUDE)
+    print("Writing exclude branch option in {}".format(tf_path))
+    with open(tf_path, "a") as travis:
+        travis.write(BRANCH_EXCLUDE)
 
-        cmd = 'git commit {} --no-verify -m "Travis: exclude new branch from build"'
-        commit = ctx.run(cmd.format(tf), hide=True)
-        print("Committed as:\n{}".format(commit.stdout.strip()))
+    cmd = 'git commit {} --no-verify -m "Travis: exclude new branch from build"'
+    commit = run_in(ctx, repo.abs_path, cmd.format(tf), hide=True)
+    print("Committed as:\n{}".format(commit.stdout.strip()))
 
 
 @task
@@ -501,7 +501,7 @@ def update(ctx, submodule_path=None):
             if os.path.normpath(path) == submodule_path
         ]
 
-    with cd(root_path()):
+    with ctx.cd(root_path()):
         ctx.run(sync_cmd)
 
         for path, url in module_list:
@@ -528,24 +528,23 @@ def sync_remote(ctx, submodule_path=None, repo=None, force_remote=False):
     repo = repo or Repo(submodule_path)
 
     if repo.has_pending_merges():
-        with open(repo.abs_merges_path) as pending_merges:
-            # read everything we can reach
-            # for reading purposes only
-            data = yaml_load(pending_merges.read())
-            submodule_pending_config = data[os.path.join(os.path.pardir, repo.path)]
-            merges_in_action = submodule_pending_config["merges"]
-            registered_remotes = submodule_pending_config["remotes"]
-
-            if force_remote:
-                new_remote_url = registered_remotes[force_remote]
-            elif merges_in_action:
-                new_remote_url = registered_remotes[GIT_C2C_REMOTE_NAME]
-            else:
-                new_remote_url = next(
-                    remote
-                    for remote in registered_remotes.values()
-                    if remote != GIT_C2C_REMOTE_NAME
-                )
+        # read everything we can reach
+        # for reading purposes only
+        data = yaml_load_path(repo.abs_merges_path)
+        submodule_pending_config = data[os.path.join(os.path.pardir, repo.path)]
+        merges_in_action = submodule_pending_config["merges"]
+        registered_remotes = submodule_pending_config["remotes"]
+
+        if force_remote:
+            new_remote_url = registered_remotes[force_remote]
+        elif merges_in_action:
+            new_remote_url = registered_remotes[GIT_C2C_REMOTE_NAME]
+        else:
+            new_remote_url = next(
+                remote
+                for remote in registered_remotes.values()
+                if remote != GIT_C2C_REMOTE_NAME
+            )
     # TODO: change depending on new structure
     # use root_path to get root project directory
     elif repo.path == "odoo/src":
@@ -584,8 +583,11 @@ def sync_remote(ctx, submodule_path=None, repo=None, force_remote=False):
         )
     )
     relative_name = repo.path.replace("../", "")
-    with cd(build_path(relative_name)):
-        ctx.run("git remote set-url origin {}".format(new_remote_url))
+    run_in(
+        ctx,
+        build_path(relative_name),
+        "git remote set-url origin {}".format(new_remote_url),
+    )
 
     print("Submodule {} is now being sourced from {}".format(repo.path, new_remote_url))
 
@@ -601,9 +603,9 @@ def sync_remote(ctx, submodule_path=None, repo=None, force_remote=False):
                 relative_name, odoo_version
             )
         ):
-            with cd(repo.abs_path):
-                os.system("git fetch origin {}".format(odoo_version))
-                os.system("git checkout origin/{}".format(odoo_version))
+            with ctx.cd(repo.abs_path):
+                ctx.run("git fetch origin {}".format(odoo_version), warn=True)
+                ctx.run("git checkout origin/{}".format(odoo_version), warn=True)
 
 
 def parse_github_url(entity_spec):
@@ -654,8 +656,9 @@ def generate_pending_merges_file_template(repo, upstream):
     That should be either `odoo/src` or `odoo/external-src/<module>`
     """
     # could be that this is the first PM ever added to this project
-    if not os.path.exists(PENDING_MERGES_DIR):
-        os.makedirs(PENDING_MERGES_DIR)
+    merges_dir = pending_merges_dir()
+    if not os.path.exists(merges_dir):
+        os.makedirs(merges_dir)
 
     oca_ocb_remote = False
     # TODO: change depending on new structure
@@ -906,14 +909,13 @@ def list_external_dependencies_installed(ctx, submodule_path):
     # TODO: change depending on new structure
     # use root_path to get root project directory
     submodule_path = build_path(submodule_path)
-    migration_modules = get_migration_file_modules(MIGRATION_FILE)
+    migration_modules = get_migration_file_modules(migration_file())
     print("\nInstalled modules from {}:\n".format(submodule_path))
     modules = []
-    with cd(submodule_path):
-        for mod in os.listdir():
-            if mod in migration_modules:
-                modules.append(mod)
-                print("\t- " + mod)
+    for mod in os.listdir(submodule_path):
+        if mod in migration_modules:
+            modules.append(mod)
+            print("\t- " + mod)
 
     # Construct a dependency name list by submodule
     submodules = {}
@@ -962,15 +964,14 @@ def _cmd_git_submodule_upgrade(ctx, path, url, branch=None):
             reference_url = ar.repo_dir
 
     if branch:
-        with cd(build_path(path)):
-            checkout_cmd = (
-                "git reset HEAD --hard &&\
-                            git fetch %s &&\
-                            git checkout %s"
-                % (url, branch)
-            )
-            print(checkout_cmd)
-            ctx.run(checkout_cmd)
+        checkout_cmd = (
+            "git reset HEAD --hard &&\
+                        git fetch %s &&\
+                        git checkout %s"
+            % (url, branch)
+        )
+        print(checkout_cmd)
+        run_in(ctx, build_path(path), checkout_cmd)
     else:
         upgrade_cmd = (
             "git submodule update -f --remote "
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+
+from odoo_tools.tasks import common
+
+MIGRATION_FILE = """
+migration:
+  options:
+    install_command: odoo
+  versions:
+    - version: setup
+      addons:
+        upgrade:
+          - base
+          - sale
+    - version: 16.0.1.0.0
+      addons:
+        upgrade:
+          - stock
+          - sale
+    - version: 16.0.1.1.0
+      operations:
+        pre:
+          - echo 'pre'
+"""
+
+
+def test_get_migration_file_modules(tmp_path):
+    path = tmp_path / "migration.yml"
+    path.write_text(MIGRATION_FILE)
+    modules = common.get_migration_file_modules(str(path))
+    assert modules == {"base", "sale", "stock"}
+
+
+def test_git_ignores(tmp_path):
+    path = tmp_path / ".gitignore"
+    path.write_bytes(b"# comment\n*.pyc\r\n\n  \t\n/build/\n  #not a comment\nlast")
+    assert common.git_ignores(str(path)) == [
+        "*.pyc",
+        "/build/",
+        "  #not a comment",
+        "last",
+    ]
+
+
+def test_yaml_load_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(common, "YAML_CACHE", OrderedDict())
+    path = tmp_path / "a.yml"
+    path.write_text("a: 1\n")
+    data = common.yaml_load_path(str(path))
+    assert data == {"a": 1}
+    # same content, same parsed data
+    other_path = tmp_path / "b.yml"
+    other_path.write_text("a: 1\n")
+    assert common.yaml_load_path(str(other_path)) is data
+    path.write_text("a: 2\n")
+    assert common.yaml_load_path(str(path)) == {"a": 2}
+
+
+def test_search_replace(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"foo = 1\r\nbar = foo\n")
+    path.chmod(0o755)
+    common.search_replace(str(path), "foo", "baz")
+    assert path.read_bytes() == b"baz = 1\r\nbar = baz\n"
+    assert path.stat().st_mode & 0o777 == 0o755
+    assert [p.name for p in tmp_path.iterdir()] == ["file.txt"]
+
+
+def test_get_migration_file_modules_merge_keys(tmp_path):
+    path = tmp_path / "migration.yml"
+    path.write_text(
+        "base: &base\n"
+        "  upgrade:\n"
+        "    - sale\n"
+        "other: &other\n"
+        "  upgrade:\n"
+        "    - purchase\n"
+        "migration:\n"
+        "  versions:\n"
+        "    - version: setup\n"
+        "      addons:\n"
+        "        <<: *base\n"
+        "    - version: 16.0.1.0.0\n"
+        "      addons:\n"
+        "        <<: [*other, *base]\n"
+        "    - version: 16.0.1.1.0\n"
+        "      addons:\n"
+        "        <<: *base\n"
+        "        upgrade:\n"
+        "          - stock\n"
+    )
+    modules = common.get_migration_file_modules(str(path))
+    assert modules == {"sale", "purchase", "stock"}
+
+
+def test_yaml_load_path_lru(tmp_path, monkeypatch):
+    monkeypatch.setattr(common, "YAML_CACHE", OrderedDict())
+    monkeypatch.setattr(common, "YAML_CACHE_SIZE", 2)
+    paths = []
+    for name in ("a", "b", "c"):
+        path = tmp_path / "{}.yml".format(name)
+        path.write_text("{}: 1\n".format(name))
+        paths.append(str(path))
+    hot = common.yaml_load_path(paths[0])
+    common.yaml_load_path(paths[1])
+    # a hit makes the entry the most recently used one
+    common.yaml_load_path(paths[0])
+    common.yaml_load_path(paths[2])
+    assert common.yaml_load_path(paths[0]) is hot
+    assert len(common.YAML_CACHE) == 2
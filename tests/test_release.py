@@ -0,0 +1,29 @@
+import pytest
+from invoke import exceptions
+
+from odoo_tools.tasks import release
+
+
+def test_release_get_next_version3digits():
+    assert release.release_get_next_version("1.2.3") == "1.3.0"
+    assert (
+        release.release_get_next_version("1.2.3", feature=False, patch=True) == "1.2.4"
+    )
+    with pytest.raises(exceptions.Exit):
+        release.release_get_next_version("1.x.3")
+
+
+def test_migration_file_has_version(tmp_path, monkeypatch):
+    path = tmp_path / "migration.yml"
+    monkeypatch.setattr(release, "migration_file", lambda: str(path))
+    assert not release.migration_file_has_version("16.0.1.1.0")
+    path.write_text(
+        "migration:\n"
+        "  versions:\n"
+        "    - version: setup\n"
+        "    - version: 16.0.1x1.0\n"
+    )
+    # dots are matched literally
+    assert not release.migration_file_has_version("16.0.1.1.0")
+    assert release.migration_file_has_version("16.0.1x1.0")
+    assert release.migration_file_has_version("setup")
@@ -0,0 +1,58 @@
+import subprocess
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from invoke import Config, Context
+
+from odoo_tools.tasks import common, submodule
+
+
+def test_process_travis_file(tmp_path, monkeypatch):
+    for var in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv("GIT_{}_NAME".format(var), "Test")
+        monkeypatch.setenv("GIT_{}_EMAIL".format(var), "test@example.com")
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    travis = tmp_path / ".travis.yml"
+    travis.write_text("language: python\n")
+    subprocess.run(["git", "add", ".travis.yml"], cwd=str(tmp_path), check=True)
+    subprocess.run(["git", "commit", "-qm", "init"], cwd=str(tmp_path), check=True)
+
+    repo = SimpleNamespace(abs_path=str(tmp_path))
+    ctx = Context(Config(overrides={"run": {"in_stream": False}}))
+    submodule.process_travis_file(ctx, repo)
+
+    assert travis.read_text().endswith(submodule.BRANCH_EXCLUDE)
+    status = subprocess.run(
+        ["git", "status", "--porcelain"],
+        cwd=str(tmp_path),
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    assert not status.stdout
+
+
+def test_merges_config_reuses_parsed_file(tmp_path, monkeypatch):
+    (tmp_path / ".cookiecutter.context.yml").write_text("project_id: '4242'\n")
+    merges_dir = tmp_path / "pending-merges.d"
+    merges_dir.mkdir()
+    (merges_dir / "test-merges-config.yml").write_text(
+        "../odoo/external-src/test-merges-config:\n"
+        "  remotes:\n"
+        "    OCA: git@github.com:OCA/test-merges-config.git\n"
+        "  merges:\n"
+        "    - OCA 16.0\n"
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(common, "YAML_CACHE", OrderedDict())
+    loads = []
+    yaml_load = common.yaml_load
+    monkeypatch.setattr(
+        common, "yaml_load", lambda stream: loads.append(stream) or yaml_load(stream)
+    )
+
+    repo = submodule.Repo("test-merges-config", path_check=False)
+    assert repo.has_pending_merges()
+    config = repo.merges_config()
+    config["merges"].append("OCA refs/pull/1/head")
+    assert repo.merges_config()["merges"] == ["OCA 16.0"]
+    assert len(loads) == 1